@@ -2,7 +2,7 @@
 AI Digital Twin + Slot Marketplace (University-wide Timetabling)
 ----------------------------------------------------------------
 Single-file Python reference implementation (minimal yet extensible) that:
-- Builds a temporal knowledge graph of a university using NetworkX
+- Builds a temporal knowledge graph of a university (typed adjacency dicts; exportable to NetworkX)
 - Defines core entities (Department, Program, Year/Term, Section, Course, Faculty, Room, Cohort, Timeslot, Policy)
 - Exposes a DigitalTwin facade to ingest data, manage versions, and run "what-if" scenarios
 - Bridges the graph to an optimization model using OR-Tools CP-SAT
@@ -13,8 +13,10 @@ Notes
 -----
 - This is a reference scaffolding you can adapt to your real data. It is kept
   compact for readability. For production, split into modules and add persistence.
-- Requires: `pip install ortools networkx` (and optionally `pydantic` if you
-  prefer validation; here we use dataclasses for simplicity).
+- Requires: `pip install ortools numpy` (and optionally `networkx` for
+  `DigitalTwin.to_networkx()`, `numba` to JIT the KPI reductions, `orjson` for
+  faster JSON export, or `pydantic` if you prefer validation; here we use
+  dataclasses for simplicity).
 
 Run
 ---
@@ -27,14 +29,62 @@ It will:
 4) Print/export allocations and KPIs
 """
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import List, Dict, Tuple, Optional, Set
+from dataclasses import dataclass, field, replace
+from typing import Callable, List, Dict, Tuple, Optional, Set
+from concurrent.futures import ProcessPoolExecutor
 import itertools
 import math
 import json
-import networkx as nx
+import os
+import numpy as np
 from ortools.sat.python import cp_model
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the decorated helpers then run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; export falls back to the stdlib json module
+    orjson = None
+
+# -----------------------------
+# Calendar & Encodings
+# -----------------------------
+
+DAYS = ["MON", "TUE", "WED", "THU", "FRI"]
+SLOTS_PER_DAY = 6  # indices: 0..5
+
+ROOM_TYPE_CODES = {"lab": 0, "smart": 1, "seminar": 2, "studio": 3}  # room_type -> int8 code (-1 if unknown)
+
+# (day, slot_index) -> bit position in a week availability mask (fits one uint64)
+SLOT_BITS: Dict[Tuple[str, int], int] = {
+    (d, i): di * SLOTS_PER_DAY + i for di, d in enumerate(DAYS) for i in range(SLOTS_PER_DAY)
+}
+
+
+def slot_bit(day: str, idx: int) -> int:
+    """Bit position of (day, slot_index); raises ValueError outside the calendar grid."""
+    try:
+        return SLOT_BITS[(day, idx)]
+    except KeyError:
+        raise ValueError(
+            f"slot ({day!r}, {idx}) is outside the calendar grid DAYS x SLOTS_PER_DAY "
+            f"({len(DAYS)} x {SLOTS_PER_DAY}); availability masks hold one bit per grid slot, "
+            f"so extend DAYS/SLOTS_PER_DAY (up to 64 slots) to use it") from None
+
+
+def slots_to_mask(slots) -> int:
+    """Pack an iterable of (day, slot_index) pairs into an availability bitmask."""
+    mask = 0
+    for (day, idx) in slots:
+        mask |= 1 << slot_bit(day, idx)
+    return mask
+
 # -----------------------------
 # Domain Models (Entities)
 # -----------------------------
@@ -95,6 +145,10 @@ class Faculty:
     preferred_windows: Set[str] = field(default_factory=set)
     historical_load: int = 0
     certifications: List[str] = field(default_factory=list)
+    avail_mask: int = field(init=False, default=0)  # availability packed via SLOT_BITS
+
+    def __post_init__(self):
+        self.avail_mask = slots_to_mask(self.availability)
 
 @dataclass
 class Room:
@@ -105,6 +159,10 @@ class Room:
     equipment: List[str]
     availability: Set[Tuple[str, int]]  # (day, slot_index)
     accessible: bool = True
+    avail_mask: int = field(init=False, default=0)  # availability packed via SLOT_BITS
+
+    def __post_init__(self):
+        self.avail_mask = slots_to_mask(self.availability)
 
 @dataclass
 class Cohort:
@@ -143,48 +201,89 @@ class TimetableVersion:
 # Digital Twin (Graph + Facade)
 # -----------------------------
 
+NodeKey = Tuple[str, str]  # (label, id)
+
+
 class DigitalTwin:
-    """University Digital Twin backed by a temporal knowledge graph (NetworkX)."""
+    """University Digital Twin backed by a temporal knowledge graph.
+
+    Nodes are attribute dicts keyed by (label, id); edges live in typed
+    adjacency dicts (node -> relation -> neighbour -> edge attrs) in both
+    directions, since the twin only ever needs neighbour lookups.
+    """
     def __init__(self):
-        self.g = nx.MultiDiGraph()
+        self._nodes: Dict[NodeKey, dict] = {}
+        self._adj_out: Dict[NodeKey, Dict[str, Dict[NodeKey, dict]]] = {}
+        self._adj_in: Dict[NodeKey, Dict[str, Dict[NodeKey, dict]]] = {}
         self.timeslots: Dict[str, Timeslot] = {}
         self.current_tt: Optional[TimetableVersion] = None
+        self._by_label: Dict[str, Dict[str, dict]] = {}  # label -> id -> node attributes
+        self._feasible_rooms_cache: Dict[Tuple[str, int], List[str]] = {}
+        self._room_soa: Optional[Dict[str, np.ndarray]] = None  # rooms as struct-of-arrays, built lazily
 
     # --- Node helpers ---
+    def _add_node(self, label: str, id_: str, obj):
+        attrs = dict(obj.__dict__)
+        self._nodes[(label, id_)] = attrs
+        # typed index shares the node's attribute dict, so in-place edits stay visible
+        self._by_label.setdefault(label, {})[id_] = attrs
+
     def add_department(self, d: Department):
-        self.g.add_node(("Department", d.dept_id), **d.__dict__)
+        self._add_node("Department", d.dept_id, d)
 
     def add_program(self, p: Program):
-        self.g.add_node(("Program", p.program_id), **p.__dict__)
+        self._add_node("Program", p.program_id, p)
 
     def add_year(self, y: YearTerm):
-        self.g.add_node(("Year", y.year_id), **y.__dict__)
+        self._add_node("Year", y.year_id, y)
 
     def add_section(self, s: Section):
-        self.g.add_node(("Section", s.section_id), **s.__dict__)
+        self._add_node("Section", s.section_id, s)
 
     def add_course(self, c: Course):
-        self.g.add_node(("Course", c.course_id), **c.__dict__)
+        self._add_node("Course", c.course_id, c)
+        self._feasible_rooms_cache.clear()
 
     def add_faculty(self, f: Faculty):
-        self.g.add_node(("Faculty", f.faculty_id), **f.__dict__)
+        self._add_node("Faculty", f.faculty_id, f)
 
     def add_room(self, r: Room):
-        self.g.add_node(("Room", r.room_id), **r.__dict__)
+        self._add_node("Room", r.room_id, r)
+        self._feasible_rooms_cache.clear()
+        self._room_soa = None
 
     def add_cohort(self, c: Cohort):
-        self.g.add_node(("Cohort", c.cohort_id), **c.__dict__)
+        self._add_node("Cohort", c.cohort_id, c)
 
     def add_timeslot(self, t: Timeslot):
+        slot_bit(t.day, t.index)  # must fit the availability bitmask calendar
         self.timeslots[t.slot_id] = t
-        self.g.add_node(("Timeslot", t.slot_id), **t.__dict__)
+        self._add_node("Timeslot", t.slot_id, t)
 
     def add_policy(self, p: Policy):
-        self.g.add_node(("Policy", p.policy_id), **p.__dict__)
+        self._add_node("Policy", p.policy_id, p)
 
     # --- Edge helpers ---
-    def link(self, a: Tuple[str, str], rel: str, b: Tuple[str, str], **attrs):
-        self.g.add_edge(a, b, key=rel, **attrs)
+    def link(self, a: NodeKey, rel: str, b: NodeKey, **attrs):
+        # one edge per (a, rel, b); relinking updates its attributes
+        out = self._adj_out.setdefault(a, {}).setdefault(rel, {})
+        if b in out:
+            out[b].update(attrs)
+        else:
+            out[b] = attrs
+            self._adj_in.setdefault(b, {}).setdefault(rel, {})[a] = attrs
+
+    def to_networkx(self):
+        """Export the twin as a networkx.MultiDiGraph (edge key = relation), e.g. for visualisation."""
+        import networkx as nx
+        g = nx.MultiDiGraph()
+        for n, attrs in self._nodes.items():
+            g.add_node(n, **attrs)
+        for a, rels in self._adj_out.items():
+            for rel, targets in rels.items():
+                for b, attrs in targets.items():
+                    g.add_edge(a, b, key=rel, **attrs)
+        return g
 
     # Convenience linkers
     def dept_offers_course(self, dept_id: str, course_id: str):
@@ -209,72 +308,125 @@ class DigitalTwin:
     # Query utilities
     # -----------------------------
     def get_node(self, label: str, id_: str) -> Dict:
-        return self.g.nodes[(label, id_)]
+        return self._nodes[(label, id_)]
 
     def neighbors(self, label: str, id_: str, rel: Optional[str] = None, direction: str = "out"):
-        n = (label, id_)
-        if direction == "out":
-            for _, b, k, data in self.g.out_edges(n, keys=True, data=True):
-                if rel is None or k == rel:
-                    yield b, k, data
-        else:
-            for a, _, k, data in self.g.in_edges(n, keys=True, data=True):
-                if rel is None or k == rel:
-                    yield a, k, data
+        adj = self._adj_out if direction == "out" else self._adj_in
+        rels = adj.get((label, id_), {})
+        for k in (rels if rel is None else (rel,)):
+            for b, data in rels.get(k, {}).items():
+                yield b, k, data
 
     # -----------------------------
     # Feasibility helpers
     # -----------------------------
+    def room_soa(self) -> Dict[str, np.ndarray]:
+        """Rooms as parallel arrays: room_ids, caps and types (ROOM_TYPE_CODES)."""
+        if self._room_soa is None:
+            rooms = self._by_label.get("Room", {})
+            self._room_soa = {
+                "room_ids": np.array(list(rooms), dtype=object),
+                "caps": np.array([d["capacity"] for d in rooms.values()], dtype=np.int32),
+                "types": np.array([ROOM_TYPE_CODES.get(d["room_type"], -1) for d in rooms.values()], dtype=np.int8),
+            }
+        return self._room_soa
+
     def feasible_rooms_for(self, course_id: str, demand_size: int) -> List[str]:
+        key = (course_id, demand_size)
+        if key in self._feasible_rooms_cache:
+            return self._feasible_rooms_cache[key]
         c: Course = self.get_node("Course", course_id)  # type: ignore
         needs_lab = c.get("facility_needs", {}).get("lab", False)
         needs_smart = c.get("facility_needs", {}).get("smart_class", False)
-        rooms = []
-        for (label, rid), data in self.g.nodes(data=True):
-            if label != "Room":
-                continue
-            if data["capacity"] < demand_size:
-                continue
-            # simple capability matching
-            if needs_lab and data["room_type"] != "lab":
-                continue
-            if needs_smart and data["room_type"] not in ("smart", "lab"):
-                continue
-            rooms.append(rid)
+        soa = self.room_soa()
+        mask = soa["caps"] >= demand_size
+        # simple capability matching
+        if needs_lab:
+            mask &= soa["types"] == ROOM_TYPE_CODES["lab"]
+        if needs_smart:
+            mask &= (soa["types"] == ROOM_TYPE_CODES["smart"]) | (soa["types"] == ROOM_TYPE_CODES["lab"])
+        rooms = soa["room_ids"][mask].tolist()
+        self._feasible_rooms_cache[key] = rooms
         return rooms
 
     def faculty_for_course(self, course_id: str) -> List[str]:
-        res = []
-        for a, k, data in self.neighbors("Course", course_id, rel=None, direction="in"):
-            if a[0] == "Faculty" and k == "CAN_TEACH":
-                res.append(a[1])
-        return res
+        return [nid for (_, nid) in self._adj_in.get(("Course", course_id), {}).get("CAN_TEACH", {})]
 
     def cohorts_for_course(self, course_id: str) -> List[Tuple[str, int]]:
         # returns list of (cohort_id, size) or (section_id, capacity) if core
-        res = []
-        for a, k, _ in self.neighbors("Course", course_id, rel=None, direction="in"):
-            if a[0] == "Cohort" and k == "ELECTS":
-                size = self.get_node("Cohort", a[1])["size"]
-                res.append((a[1], size))
-            if a[0] == "Section" and k == "TAKES":
-                cap = self.get_node("Section", a[1])["capacity"]
-                res.append((a[1], cap))
+        incoming = self._adj_in.get(("Course", course_id), {})
+        sections = self._by_label.get("Section", {})
+        cohorts = self._by_label.get("Cohort", {})
+        res = [(sid, sections[sid]["capacity"]) for (_, sid) in incoming.get("TAKES", {})]
+        res += [(cid, cohorts[cid]["size"]) for (_, cid) in incoming.get("ELECTS", {})]
         return res
 
 # -----------------------------
 # Solver Bridge (CP-SAT)
 # -----------------------------
 
+@dataclass
+class SolverParams:
+    """CP-SAT search parameters for TimetableSolver.solve.
+
+    The best portfolio depends on problem shape, so the defaults are only a
+    starting point. Keep presolve on for production-sized models; turning it
+    off only pays on tiny models where presolve costs more than the search.
+    """
+    max_time_s: float = 10
+    num_search_workers: int = field(default_factory=lambda: min(os.cpu_count() or 1, 16))
+    linearization_level: int = 1
+    cp_model_probing_level: int = 2
+    cp_model_presolve: bool = True
+    optimize_with_core: bool = False
+    log_search_progress: bool = False
+
+
 class TimetableSolver:
-    """Builds and solves a CP-SAT model from a DigitalTwin snapshot."""
-    def __init__(self, twin: DigitalTwin):
+    """Builds and solves a CP-SAT model from a DigitalTwin snapshot.
+
+    Each session is a unit-length interval on a flat slot axis (one position per
+    timeslot). Room, faculty and cohort exclusivity are NoOverlap constraints over
+    the (optional) intervals that use each resource.
+
+    ``light_propagation`` keeps the NoOverlap propagation cheap: strong
+    disjunctive propagation (edge-finding, not-last) stays off and precedence
+    reasoning in the disjunctive is disabled; they rarely prune on sparse
+    timetables. Pass False for instances with many conflicts: that turns on
+    strong disjunctive propagation and precedences, plus the overload checker
+    and timetable edge-finding, which only act on cumulative constraints (none
+    in this model) and are there for resources added later.
+
+    ``symmetry_breaking`` orders interchangeable sessions and sections so the
+    search does not revisit permuted copies of the same timetable. Turn it
+    off when debugging a specific assignment.
+    """
+    def __init__(self, twin: DigitalTwin, light_propagation: bool = True, symmetry_breaking: bool = True):
         self.twin = twin
+        self.light_propagation = light_propagation
+        self.symmetry_breaking = symmetry_breaking
         self.model = cp_model.CpModel()
-        self.x = {}  # decision vars: (session_key, room_id, slot_id) -> BoolVar
-        self.y_faculty_slot = {}  # (faculty_id, day, idx) -> BoolVar (teaching that slot)
+        self.start = {}  # session_key -> IntVar (position on the flat slot axis)
+        self.room_choice = {}  # session_key -> IntVar (position in self.room_ids)
+        self.fac_choice = {}  # session_key -> IntVar (position in self.faculty_ids)
+        self.room_lit = {}  # (session_key, room_id) -> BoolVar (session held in that room)
+        self.fac_lit = {}  # (session_key, faculty_id) -> BoolVar (session taught by that faculty)
+        self.room_iv = {}  # (session_key, room_id) -> optional IntervalVar
+        self.fac_iv = {}  # (session_key, faculty_id) -> optional IntervalVar
+        self.cohort_iv = {}  # session_key -> IntervalVar
+        self.room_slots = {}  # session_key -> room_id -> usable slot positions
+        self.fac_slots = {}  # session_key -> faculty_id -> usable slot positions
         self.session_meta = {}  # session_key -> dict(course_id, cohort_id, faculty_id, duration)
+        self.faculty_assign: Dict[str, str] = {}  # session_key -> faculty_id, filled by solve()
+        self._hinted = False
         self.slots_by_day = self._slots_by_day()
+        self.slot_ids: List[str] = list(self.twin.timeslots)
+        self.slot_pos: Dict[str, int] = {ts_id: i for i, ts_id in enumerate(self.slot_ids)}
+        self.slot_bits: List[int] = [slot_bit(ts.day, ts.index) for ts in self.twin.timeslots.values()]
+        self.room_ids: List[str] = list(self.twin._by_label.get("Room", {}))
+        self.room_pos: Dict[str, int] = {rid: i for i, rid in enumerate(self.room_ids)}
+        self.faculty_ids: List[str] = list(self.twin._by_label.get("Faculty", {}))
+        self.fac_pos: Dict[str, int] = {fid: i for i, fid in enumerate(self.faculty_ids)}
 
     # --- Timeslot utilities ---
     def _slots_by_day(self) -> Dict[str, List[Timeslot]]:
@@ -291,9 +443,7 @@ class TimetableSolver:
         NOTE: Graph nodes store dict attributes; access via dict keys, not dataclass attrs.
         """
         session_keys = []
-        for (label, cid), cdata in self.twin.g.nodes(data=True):
-            if label != "Course":
-                continue
+        for cid, cdata in self.twin._by_label.get("Course", {}).items():
             # cdata is a dict of attributes as stored in the graph
             total_hours = int(cdata.get("hours_theory", 0)) + int(cdata.get("hours_lab", 0))
             if total_hours <= 0:
@@ -319,79 +469,86 @@ class TimetableSolver:
                     session_keys.append(session_key)
         return session_keys
 
-    def build(self, pins: Optional[Set[str]] = None):
+    def build(self, pins: Optional[Set[str]] = None, hint_from: Optional[TimetableVersion] = None):
+        """Build the model. ``hint_from`` warm-starts the search from a previous
+        timetable (its faculty choices are read from ``meta["faculty"]`` if present)."""
         pins = pins or set()
         session_keys = self._expand_sessions()
 
-        # Decision vars: x[session, room, slot]
+        # Decision vars: start slot, room choice and faculty choice per session.
+        # Every room/faculty candidate gets a presence literal channelled to the
+        # choice var and an optional interval that only exists when it is chosen.
+        # Only (slot, room) and (slot, faculty) pairs where the room, and at least
+        # one candidate faculty, are available are ever allowed; candidates with
+        # no such slot get no literal at all.
+        # Sessions with the same course, candidate faculty and feasible rooms
+        # (e.g. every section taking one core course) share their placement
+        # tables, so those are derived once per group.
+        placements: Dict[tuple, tuple] = {}
+        # inverted indices filled while creating vars: resource -> intervals using it
+        by_room: Dict[str, list] = {}
+        by_fac: Dict[str, list] = {}
+        by_cohort: Dict[str, list] = {}
+        by_lit_name: Dict[str, Tuple[str, str]] = {}  # room literal name -> (session_key, room_id)
         for sk in session_keys:
             meta = self.session_meta[sk]
-            for r in meta["feasible_rooms"]:
-                for ts in self.twin.timeslots.values():
-                    var = self.model.NewBoolVar(f"x_{sk}_{r}_{ts.slot_id}")
-                    self.x[(sk, r, ts.slot_id)] = var
+            group = (meta["course_id"], tuple(meta["candidate_faculties"]), tuple(meta["feasible_rooms"]))
+            if group not in placements:
+                placements[group] = self._placement_tables(meta)
+            start_values, room_slots, fac_slots, room_tuples, fac_tuples = placements[group]
+            self.room_slots[sk], self.fac_slots[sk] = room_slots, fac_slots
+            if not room_slots or not fac_slots:
+                del self.session_meta[sk]  # cannot be placed anywhere
+                continue
 
-        # Each session must be scheduled exactly once (room & slot)
-        for sk in session_keys:
-            vars_for_session = [self.x[(sk, r, ts_id)] for (sk2, r, ts_id) in self.x if sk2 == sk]
-            if vars_for_session:
-                self.model.Add(sum(vars_for_session) == 1)
+            # domains are exactly the usable values, not the full slot/room/faculty ranges
+            start = self.model.NewIntVarFromDomain(cp_model.Domain.FromValues(start_values), f"start_{sk}")
+            room = self.model.NewIntVarFromDomain(
+                cp_model.Domain.FromValues([self.room_pos[r] for r in room_slots]), f"room_{sk}")
+            fac = self.model.NewIntVarFromDomain(
+                cp_model.Domain.FromValues([self.fac_pos[f] for f in fac_slots]), f"fac_{sk}")
+            self.start[sk], self.room_choice[sk], self.fac_choice[sk] = start, room, fac
+            self.cohort_iv[sk] = self.model.NewIntervalVar(start, 1, start + 1, f"iv_{sk}")
+            by_cohort.setdefault(meta["cohort_id"], []).append(self.cohort_iv[sk])
+
+            room_lits = []
+            for r in room_slots:
+                lit = self.model.NewBoolVar(f"x_{sk}_{r}")
+                self.model.Add(room == self.room_pos[r]).OnlyEnforceIf(lit)
+                self.room_lit[(sk, r)] = lit
+                self.room_iv[(sk, r)] = self.model.NewOptionalIntervalVar(start, 1, start + 1, lit, f"iv_{sk}_{r}")
+                by_room.setdefault(r, []).append(self.room_iv[(sk, r)])
+                by_lit_name[lit.Name()] = (sk, r)
+                room_lits.append(lit)
+            # Each session must be scheduled exactly once (room & slot)
+            self.model.AddExactlyOne(room_lits)
+            self.model.AddAllowedAssignments([start, room], room_tuples)
+
+            fac_lits = []
+            for f in fac_slots:
+                lit = self.model.NewBoolVar(f"y_{sk}_{f}")
+                self.model.Add(fac == self.fac_pos[f]).OnlyEnforceIf(lit)
+                self.fac_lit[(sk, f)] = lit
+                self.fac_iv[(sk, f)] = self.model.NewOptionalIntervalVar(start, 1, start + 1, lit, f"iv_{sk}_{f}")
+                by_fac.setdefault(f, []).append(self.fac_iv[(sk, f)])
+                fac_lits.append(lit)
+            self.model.AddExactlyOne(fac_lits)
+            self.model.AddAllowedAssignments([start, fac], fac_tuples)
 
         # No double-booking rooms per slot
-        for (label, rid), rdata in self.twin.g.nodes(data=True):
-            if label != "Room":
-                continue
-            for ts in self.twin.timeslots.values():
-                vars_room_slot = [self.x[key] for key in self.x if key[1] == rid and key[2] == ts.slot_id]
-                if vars_room_slot:
-                    self.model.Add(sum(vars_room_slot) <= 1)
-
-        # Faculty availability + one course per faculty per slot
-        # Create implicit faculty-slot vars and link
-        fac_slot_vars: Dict[Tuple[str, str, int], List[cp_model.IntVar]] = {}
-        for sk, meta in self.session_meta.items():
-            cid = meta["course_id"]
-            candidates = meta["candidate_faculties"]
-            for r in meta["feasible_rooms"]:
-                for ts in self.twin.timeslots.values():
-                    xvar = self.x[(sk, r, ts.slot_id)]
-                    day, idx = ts.day, ts.index
-                    # Build a selector that this session uses a specific faculty
-                    # We introduce y_sk_f vars for faculty choice and couple to x via constraints
-                    for f in candidates:
-                        y_f = self.y_faculty_slot.setdefault((f, day, idx), self.model.NewBoolVar(f"y_{f}_{day}_{idx}"))
-                        fac_slot_vars.setdefault((f, day, idx), []).append(xvar)
-                        # If xvar chosen, then that slot must be marked as faculty teaching
-                        self.model.AddImplication(xvar, y_f)
+        for intervals in by_room.values():
+            if len(intervals) > 1:
+                self.model.AddNoOverlap(intervals)
 
         # Faculty cannot teach two sessions at the same time
-        for key, arr in fac_slot_vars.items():
-            # This ensures if any x uses this faculty-slot, y is 1, but we also bound the sum
-            self.model.Add(sum(arr) <= 1)
+        for intervals in by_fac.values():
+            if len(intervals) > 1:
+                self.model.AddNoOverlap(intervals)
 
         # Section/Cohort no-overlap per slot
-        cohort_slot_vars: Dict[Tuple[str, str, int], List[cp_model.IntVar]] = {}
-        for sk, meta in self.session_meta.items():
-            cohort = meta["cohort_id"]
-            for r in meta["feasible_rooms"]:
-                for ts in self.twin.timeslots.values():
-                    xvar = self.x[(sk, r, ts.slot_id)]
-                    cohort_slot_vars.setdefault((cohort, ts.day, ts.index), []).append(xvar)
-        for key, arr in cohort_slot_vars.items():
-            self.model.Add(sum(arr) <= 1)
-
-        # Respect room availability
-        for (label, rid), rdata in self.twin.g.nodes(data=True):
-            if label != "Room":
-                continue
-            avail: Set[Tuple[str, int]] = rdata["availability"]
-            allowed = {(day, idx) for (day, idx) in avail}
-            for ts in self.twin.timeslots.values():
-                if (ts.day, ts.index) not in allowed:
-                    # room not available in this slot => force 0
-                    for sk in session_keys:
-                        if (sk, rid, ts.slot_id) in self.x:
-                            self.model.Add(self.x[(sk, rid, ts.slot_id)] == 0)
+        for intervals in by_cohort.values():
+            if len(intervals) > 1:
+                self.model.AddNoOverlap(intervals)
 
         # (Optional) Faculty daily load caps (soft via penalties, here as hard approximation)
         # You can compute post-solution fairness KPIs instead for simplicity.
@@ -400,37 +557,187 @@ class TimetableSolver:
         for pin_key in pins:
             # pin_key format: "x_{session}_{room}_{slot}" or session_key only
             if pin_key.startswith("x_"):
-                # exact var pin
-                name = pin_key
-                # find the var by name
-                for key, var in self.x.items():
-                    if var.Name() == name:
-                        self.model.Add(var == 1)
+                # exact pin: the session must use that room at that slot
+                for ts_id, pos in self.slot_pos.items():
+                    key = by_lit_name.get(pin_key[:-len(ts_id) - 1]) if pin_key.endswith(f"_{ts_id}") else None
+                    if key is not None:
+                        self.model.Add(self.room_lit[key] == 1)
+                        self.model.Add(self.start[key[0]] == pos)
             else:
                 # pin by session meta in current_tt
                 pass
 
+        # Symmetry breaking (pinned assignments need not respect the canonical order)
+        if self.symmetry_breaking and not pins:
+            self._break_symmetries()
+
+        # Warm start: hint every session that still exists with its previous placement
+        if hint_from is not None:
+            prev_fac = hint_from.meta.get("faculty", {})
+            for sk, start in self.start.items():
+                if sk not in hint_from.assignments:
+                    continue
+                _, rid, ts_id = hint_from.assignments[sk]
+                if ts_id in self.slot_pos:
+                    self.model.AddHint(start, self.slot_pos[ts_id])
+                if rid in self.room_pos:
+                    self.model.AddHint(self.room_choice[sk], self.room_pos[rid])
+                if prev_fac.get(sk) in self.fac_pos:
+                    self.model.AddHint(self.fac_choice[sk], self.fac_pos[prev_fac[sk]])
+                self._hinted = True
+
         # Objective: minimize simple proxy for student gaps + encourage room utilization band
         # For brevity, we'll just maximize total assigned sessions in mid-day slots (proxy compactness)
-        objective_terms = []
         MIDDAY_IDXS = {2, 3, 4}  # e.g., indices considered compact window
-        for (sk, r, ts_id), var in self.x.items():
-            ts = self.twin.timeslots[ts_id]
-            if ts.index in MIDDAY_IDXS:
-                objective_terms.append(var)
+        is_midday = [1 if self.twin.timeslots[ts_id].index in MIDDAY_IDXS else 0 for ts_id in self.slot_ids]
+        objective_terms = []
+        for sk, start in self.start.items():
+            # one Boolean per session, read off the flat slot position
+            midday = self.model.NewBoolVar(f"midday_{sk}")
+            self.model.AddElement(start, is_midday, midday)
+            objective_terms.append(midday)
         self.model.Maximize(sum(objective_terms))
 
-    def solve(self, max_time_s: int = 10) -> Tuple[int, Dict[str, Tuple[str, str, str]]]:
+    def _placement_tables(self, meta: Dict):
+        """Usable start positions of a session, usable slot positions per feasible room
+        and candidate faculty, plus the matching (start, room) and (start, faculty)
+        allowed tuples."""
+        rooms = self.twin._by_label.get("Room", {})
+        faculty = self.twin._by_label.get("Faculty", {})
+        fac_mask = 0
+        for f in meta["candidate_faculties"]:
+            fac_mask |= faculty[f]["avail_mask"]
+        room_slots = {}  # room_id -> usable slot positions
+        for r in meta["feasible_rooms"]:
+            mask = rooms[r]["avail_mask"] & fac_mask
+            usable = [pos for pos, bit in enumerate(self.slot_bits) if (mask >> bit) & 1]
+            if usable:
+                room_slots[r] = usable
+        open_mask = 0
+        for usable in room_slots.values():
+            for pos in usable:
+                open_mask |= 1 << self.slot_bits[pos]
+        fac_slots = {}  # faculty_id -> usable slot positions
+        for f in meta["candidate_faculties"]:
+            mask = faculty[f]["avail_mask"] & open_mask
+            usable = [pos for pos, bit in enumerate(self.slot_bits) if (mask >> bit) & 1]
+            if usable:
+                fac_slots[f] = usable
+        room_tuples = [(pos, self.room_pos[r]) for r, usable in room_slots.items() for pos in usable]
+        fac_tuples = [(pos, self.fac_pos[f]) for f, usable in fac_slots.items() for pos in usable]
+        start_values = sorted({pos for usable in room_slots.values() for pos in usable})
+        return start_values, room_slots, fac_slots, room_tuples, fac_tuples
+
+    def _break_symmetries(self):
+        """Sessions of one course for one cohort are interchangeable, so their starts
+        are made strictly increasing. Cohorts/sections with identical demand (same
+        courses, size, candidate faculty and rooms) can swap whole schedules, so
+        their start vectors are lexicographically ordered."""
+        starts_by_course: Dict[Tuple[str, str], List[cp_model.IntVar]] = {}
+        courses_by_cohort: Dict[str, Set[str]] = {}
+        for sk in self.start:
+            meta = self.session_meta[sk]
+            starts_by_course.setdefault((meta["cohort_id"], meta["course_id"]), []).append(self.start[sk])
+            courses_by_cohort.setdefault(meta["cohort_id"], set()).add(meta["course_id"])
+        for arr in starts_by_course.values():
+            for a, b in zip(arr, arr[1:]):
+                self.model.Add(a < b)
+
+        # Group cohorts by their full demand signature
+        demand: Dict[str, list] = {}
+        for sk in self.start:
+            meta = self.session_meta[sk]
+            demand.setdefault(meta["cohort_id"], []).append(
+                (meta["course_id"], meta["size"], tuple(sorted(meta["candidate_faculties"])),
+                 tuple(sorted(meta["feasible_rooms"]))))
+        classes: Dict[tuple, List[str]] = {}
+        for cohort in sorted(demand):
+            classes.setdefault(tuple(sorted(demand[cohort])), []).append(cohort)
+        for members in classes.values():
+            vectors = [
+                [v for cid in sorted(courses_by_cohort[cohort]) for v in starts_by_course[(cohort, cid)]]
+                for cohort in members
+            ]
+            for a, b in zip(vectors, vectors[1:]):
+                self._add_lex_leq(a, b)
+
+    def _add_lex_leq(self, a: List[cp_model.IntVar], b: List[cp_model.IntVar]):
+        """Constrain vector ``a`` to be lexicographically <= vector ``b``."""
+        prefix_eq = None  # literal: a[:i] == b[:i] (None means trivially true)
+        for i, (x, y) in enumerate(zip(a, b)):
+            ct = self.model.Add(x <= y)
+            if prefix_eq is not None:
+                ct.OnlyEnforceIf(prefix_eq)
+            if i == len(a) - 1:
+                break
+            eq = self.model.NewBoolVar("")
+            self.model.Add(x == y).OnlyEnforceIf(eq)
+            self.model.Add(x != y).OnlyEnforceIf(eq.Not())
+            if prefix_eq is None:
+                prefix_eq = eq
+            else:
+                both = self.model.NewBoolVar("")
+                self.model.AddBoolAnd([prefix_eq, eq]).OnlyEnforceIf(both)
+                self.model.AddBoolOr([prefix_eq.Not(), eq.Not()]).OnlyEnforceIf(both.Not())
+                prefix_eq = both
+
+    def build_repair(self, prev: TimetableVersion, invalidated_sessions: Set[str]):
+        """Build a repair model around ``prev``: every session outside
+        ``invalidated_sessions`` is fixed to its previous slot, room and faculty,
+        so CP-SAT only has to re-place the invalidated ones."""
+        # ordering constraints could contradict the sessions kept in place
+        self.symmetry_breaking = False
+        self.build(hint_from=prev)
+        prev_fac = prev.meta.get("faculty", {})
+        for sk, start in self.start.items():
+            if sk in invalidated_sessions or sk not in prev.assignments:
+                continue
+            _, rid, ts_id = prev.assignments[sk]
+            fid = prev_fac.get(sk)
+            pos = self.slot_pos.get(ts_id)
+            if pos is None or pos not in self.room_slots[sk].get(rid, ()):
+                continue  # room (or the slot itself) no longer usable there; leave it free
+            if fid is not None and pos not in self.fac_slots[sk].get(fid, ()):
+                continue  # previous faculty no longer available at that slot; leave it free
+            self.model.Add(self.room_lit[(sk, rid)] == 1)
+            self.model.Add(start == pos)
+            self.model.Add(self.room_choice[sk] == self.room_pos[rid])
+            if fid is not None:
+                self.model.Add(self.fac_choice[sk] == self.fac_pos[fid])
+
+    def solve(self, max_time_s: Optional[float] = None,
+              params: Optional[SolverParams] = None) -> Tuple[int, Dict[str, Tuple[str, str, str]]]:
+        params = params or SolverParams()
+        if max_time_s is not None:
+            params = replace(params, max_time_s=max_time_s)
         solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = max_time_s
-        solver.parameters.num_search_workers = 8
+        solver.parameters.max_time_in_seconds = params.max_time_s
+        solver.parameters.num_search_workers = params.num_search_workers
+        solver.parameters.linearization_level = params.linearization_level
+        solver.parameters.cp_model_probing_level = params.cp_model_probing_level
+        solver.parameters.cp_model_presolve = params.cp_model_presolve
+        solver.parameters.optimize_with_core = params.optimize_with_core
+        solver.parameters.log_search_progress = params.log_search_progress
+        if self._hinted:
+            # hints from a previous version may be partly infeasible after a what-if
+            solver.parameters.repair_hint = True
+        if self.light_propagation:
+            solver.parameters.use_strong_propagation_in_disjunctive = False
+            solver.parameters.use_precedences_in_disjunctive_constraint = False
+        else:
+            solver.parameters.use_strong_propagation_in_disjunctive = True
+            solver.parameters.use_precedences_in_disjunctive_constraint = True
+            solver.parameters.use_overload_checker_in_cumulative = True
+            solver.parameters.use_timetable_edge_finding_in_cumulative = True
         status = solver.Solve(self.model)
         assign: Dict[str, Tuple[str, str, str]] = {}
         if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-            for (sk, r, ts_id), var in self.x.items():
-                if solver.Value(var) == 1:
-                    cid = self.session_meta[sk]["course_id"]
-                    assign[sk] = (cid, r, ts_id)
+            for sk, start in self.start.items():
+                cid = self.session_meta[sk]["course_id"]
+                rid = self.room_ids[solver.Value(self.room_choice[sk])]
+                ts_id = self.slot_ids[solver.Value(start)]
+                assign[sk] = (cid, rid, ts_id)
+                self.faculty_assign[sk] = self.faculty_ids[solver.Value(self.fac_choice[sk])]
         return status, assign
 
 # -----------------------------
@@ -440,22 +747,87 @@ class TimetableSolver:
 def apply_faculty_leave(twin: DigitalTwin, faculty_id: str, day: str, idx_from: int, idx_to: int):
     """Remove availability for a faculty across a range of slot indices for a given day."""
     f = twin.get_node("Faculty", faculty_id)
-    new_avail = set([slot for slot in f["availability"] if not (slot[0] == day and idx_from <= slot[1] <= idx_to)])
-    f["availability"] = new_avail
+    leave = {(day, idx) for idx in range(idx_from, idx_to + 1) if (day, idx) in SLOT_BITS}
+    f["avail_mask"] &= ~slots_to_mask(leave)
+    f["availability"] = f["availability"] - leave  # sets may be shared between nodes
+
+
+def invalidated_by_leave(twin: DigitalTwin, faculty_id: str, day: str, idxs) -> Set[str]:
+    """Sessions of ``twin.current_tt`` taught by ``faculty_id`` on ``day`` at one of ``idxs``.
+    Uses the recorded faculty (``meta["faculty"]``) when available, else any qualified faculty."""
+    prev = twin.current_tt
+    if prev is None:
+        return set()
+    prev_fac = prev.meta.get("faculty", {})
+    idxs = set(idxs)
+    hit = set()
+    for sk, (cid, _, ts_id) in prev.assignments.items():
+        ts = twin.timeslots[ts_id]
+        if ts.day != day or ts.index not in idxs:
+            continue
+        if sk in prev_fac:
+            teaches = prev_fac[sk] == faculty_id
+        else:
+            teaches = faculty_id in twin.faculty_for_course(cid)
+        if teaches:
+            hit.add(sk)
+    return hit
+
+
+def _solve_scenario(twin: DigitalTwin, scenario: Callable[[DigitalTwin], None],
+                    num_search_workers: int, max_time_s: int):
+    # runs in a worker process on its own unpickled copy of the twin
+    scenario(twin)
+    solver = TimetableSolver(twin)
+    solver.build()
+    _, assign = solver.solve(params=SolverParams(max_time_s=max_time_s, num_search_workers=num_search_workers))
+    return assign, kpis(assign, twin)
+
+
+def run_scenarios(twin: DigitalTwin, scenarios: List[Callable[[DigitalTwin], None]], workers: int = 4,
+                  max_time_s: int = 10) -> List[Tuple[Dict[str, Tuple[str, str, str]], Dict[str, float]]]:
+    """Solve independent what-if scenarios in parallel processes.
+
+    Each scenario mutates its own copy of ``twin`` (the caller's twin is left
+    untouched) and returns (assignments, kpis), in scenario order. Scenarios
+    must be picklable, e.g. module-level functions or ``functools.partial``
+    over ``apply_faculty_leave``. CP-SAT workers are split across processes
+    to avoid oversubscribing the CPU.
+    """
+    per_solver = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_solve_scenario, twin, sc, per_solver, max_time_s) for sc in scenarios]
+        return [fut.result() for fut in futures]
 
 # -----------------------------
 # KPIs & Reporting
 # -----------------------------
 
+@njit(cache=True)
+def _count_clashes(room_idx: np.ndarray, slot_idx: np.ndarray, n_rooms: int, n_slots: int) -> Tuple[int, int]:
+    """Return (clashing cells, occupied cells) of the room x slot grid hit by the parallel index arrays."""
+    grid = np.zeros(n_rooms * n_slots, dtype=np.int32)
+    for i in range(room_idx.shape[0]):
+        grid[room_idx[i] * n_slots + slot_idx[i]] += 1
+    clashes = 0
+    occupied = 0
+    for c in grid:
+        if c > 1:
+            clashes += 1
+        if c > 0:
+            occupied += 1
+    return clashes, occupied
+
+
 def kpis(assign: Dict[str, Tuple[str, str, str]], twin: DigitalTwin) -> Dict[str, float]:
     # Minimal KPIs for illustration
-    by_room_slot = {}
-    for sk, (cid, rid, tsid) in assign.items():
-        by_room_slot.setdefault((rid, tsid), 0)
-        by_room_slot[(rid, tsid)] += 1
-    clashes = sum(1 for v in by_room_slot.values() if v > 1)
+    room_pos = {rid: i for i, rid in enumerate(twin._by_label.get("Room", {}))}
+    slot_pos = {ts_id: i for i, ts_id in enumerate(twin.timeslots)}
+    room_idx = np.fromiter((room_pos[rid] for (_, rid, _) in assign.values()), dtype=np.int64, count=len(assign))
+    slot_idx = np.fromiter((slot_pos[tsid] for (_, _, tsid) in assign.values()), dtype=np.int64, count=len(assign))
+    clashes, occupied = _count_clashes(room_idx, slot_idx, len(room_pos), len(slot_pos))
 
-    utilization = len(by_room_slot) / max(1, (len([n for n in twin.g.nodes if n[0]=="Room"]) * len(twin.timeslots)))
+    utilization = occupied / max(1, len(room_pos) * len(slot_pos))
     return {
         "room_slot_clashes": float(clashes),
         "utilization_ratio": round(utilization, 3),
@@ -466,8 +838,6 @@ def kpis(assign: Dict[str, Tuple[str, str, str]], twin: DigitalTwin) -> Dict[str
 # Example Bootstrapping (Toy Data)
 # -----------------------------
 
-DAYS = ["MON", "TUE", "WED", "THU", "FRI"]
-SLOTS_PER_DAY = 6  # indices: 0..5
 START_MIN = {0: 9*60, 1: 10*60, 2: 11*60, 3: 12*60+30, 4: 14*60, 5: 15*60}
 
 
@@ -548,14 +918,17 @@ if __name__ == "__main__":
     for k, v in list(assign.items())[:10]:
         print(k, "->", v)
     print("KPIs:", kpis(assign, twin))
+    twin.current_tt = TimetableVersion("TT-BASE", assign, meta={"faculty": solver.faculty_assign})
 
     # Apply a What-If: Faculty leave
     print("\n=== What-If: Faculty F-CS-1 on leave WED slots 2..4 (auto-heal) ===")
     apply_faculty_leave(twin, "F-CS-1", day="WED", idx_from=2, idx_to=4)
+    invalidated = invalidated_by_leave(twin, "F-CS-1", day="WED", idxs=range(2, 5))
+    print("Invalidated sessions:", sorted(invalidated))
 
     solver2 = TimetableSolver(twin)
-    # Pin nothing in toy; in real use, pass twin.current_tt.pins
-    solver2.build(pins=set())
+    # Keep every unaffected session in place; only the invalidated ones are re-solved
+    solver2.build_repair(twin.current_tt, invalidated)
     status2, assign2 = solver2.solve(max_time_s=10)
     print("Status:", status2)
     for k, v in list(assign2.items())[:10]:
@@ -564,9 +937,13 @@ if __name__ == "__main__":
 
     # Export a compact JSON for UI consumption
     output = {
-        "assignments": assign2,
-        "timeslots": {k: twin.timeslots[k].__dict__ for k in twin.timeslots},
+        "assignments": {sk: list(v) for sk, v in assign2.items()},
+        "timeslots": {k: ts.__dict__ for k, ts in twin.timeslots.items()},
     }
-    with open("timetable_output.json", "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2)
+    if orjson is not None:
+        with open("timetable_output.json", "wb") as f:
+            f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    else:
+        with open("timetable_output.json", "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
     print("\nExported timetable_output.json")